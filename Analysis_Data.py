@@ -0,0 +1,256 @@
+import hashlib
+import json
+import pandas as pd
+from os import getcwd, listdir, makedirs, remove, replace, stat, utime
+from os.path import join, exists
+
+# Bump whenever the preparation below changes, so cached frames from older code are not reused.
+LOADER_VERSION = 1
+
+# Number of prepared frames kept on disk. The least recently used are evicted first.
+MAX_CACHE_ENTRIES = 8
+
+# Need to identify which outcomes count as finishes
+METHOD_MAP = {'Submission': True, 'KO/TKO': True, 'TKO - Doctor\'s Stoppage': True, 'DQ': True,
+              'Could Not Continue': True, 'Decision - Split': False, 'Decision - Majority': False,
+              'Decision - Unanimous': False, 'Overturned': False}
+
+# Weight classes ordered by weight
+WEIGHT_CLASSES = ['Strawweight', 'Flyweight', 'Bantamweight', 'Featherweight', 'Lightweight', 'Welterweight',
+                  'Middleweight', 'Light Heavyweight', 'Heavyweight']
+
+
+def get_processed_dir():
+    """Directory holding All_Fights.csv and All_Fighters.csv.
+
+    Returns
+    -------
+    str
+    """
+    return getcwd() + '/UFCStats_Dicts/Processed/'
+
+
+def finish_flags(method, round_seen, round_time):
+    """Determine which bouts ended in a finish.
+
+    We want to include overturned fight outcomes, because a daily fantasy sports tournament will not
+    be affected by a fight outcome that was overturned weeks later.
+    Overturned bouts do not list the method of finish.
+    However, a finish can be inferred from round and round time of the fight.
+
+    Parameters
+    ----------
+    method : pandas.Series
+    round_seen : pandas.Series
+    round_time : pandas.Series
+
+    Returns
+    -------
+    pandas.Series
+        nan for methods missing from METHOD_MAP
+    """
+    finish = method.map(METHOD_MAP)
+    went_the_distance = (pd.to_numeric(round_seen, errors='coerce') == 3) & (round_time == '5:00')
+    return finish.mask((method == 'Overturned') & ~went_the_distance, True)
+
+
+def source_manifest(filenames):
+    """Describe the source files well enough to notice when any of them change.
+
+    Parameters
+    ----------
+    filenames : list of str
+        files in the processed directory
+
+    Returns
+    -------
+    list of list
+        [filename, size, modification time in ns] for each file
+    """
+    manifest = []
+    for filename in filenames:
+        file_stat = stat(join(get_processed_dir(), filename))
+        manifest.append([filename, file_stat.st_size, file_stat.st_mtime_ns])
+    return manifest
+
+
+def cache_key(name, filenames, options):
+    """Hash of the source manifest, loader version, pandas version and loader options.
+
+    Parameters
+    ----------
+    name : str
+        name of the loader
+    filenames : list of str
+    options : dict
+        keyword arguments of the loader
+
+    Returns
+    -------
+    str
+    """
+    key = json.dumps({'name': name, 'version': LOADER_VERSION, 'pandas': pd.__version__,
+                      'sources': source_manifest(filenames), 'options': options}, sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def evict_cache_entries(cache_dir, max_entries=MAX_CACHE_ENTRIES):
+    """Remove the least recently used cached frames beyond max_entries.
+
+    Entries for outdated sources or loader versions are never used again, so they age out here.
+
+    Parameters
+    ----------
+    cache_dir : str
+    max_entries : int, optional
+    """
+    entries = [join(cache_dir, f) for f in listdir(cache_dir) if f.endswith('.pkl')]
+    entries.sort(key=lambda path: stat(path).st_mtime_ns, reverse=True)
+    for path in entries[max_entries:]:
+        try:
+            remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def cached(name, filenames, options, prepare):
+    """Return a prepared frame from the on-disk cache, preparing and storing it on a miss.
+
+    Parameters
+    ----------
+    name : str
+        name of the loader
+    filenames : list of str
+        source files in the processed directory
+    options : dict
+        keyword arguments of the loader
+    prepare : callable
+        called with no arguments to build the frame on a miss
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    cache_dir = getcwd() + '/UFCStats_Dicts/Cache/'
+    if not exists(cache_dir):
+        makedirs(cache_dir)
+    path = join(cache_dir, name + '_' + cache_key(name, filenames, options) + '.pkl')
+    if exists(path):
+        try:
+            df = pd.read_pickle(path)
+        except Exception as err:
+            # e.g. written by an incompatible pandas version or cut short; rebuild it
+            print('Ignoring unreadable cache entry', path, '-', repr(err))
+            remove(path)
+        else:
+            # mark as recently used
+            utime(path)
+            return df
+
+    df = prepare()
+    tmp_path = path + '.tmp'
+    df.to_pickle(tmp_path)
+    replace(tmp_path, path)
+    evict_cache_entries(cache_dir)
+    return df
+
+
+def prepare_fights(since=None, three_round_only=False, standard_weight_classes=False):
+    """Read All_Fights.csv and add the columns used in the analyses.
+
+    Parameters
+    ----------
+    since : datetime-like, optional
+    three_round_only : bool, optional
+    standard_weight_classes : bool, optional
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    df = pd.read_csv(join(get_processed_dir(), 'All_Fights.csv'), parse_dates=['EventDate'])
+    if since is not None:
+        df = df[df.EventDate >= pd.Timestamp(since)].copy()
+    if three_round_only:
+        df = df[df.RoundFormat.str[0] == '3']
+    if standard_weight_classes:
+        df = df[df.WeightClass.isin(WEIGHT_CLASSES)].copy()
+        df['WeightClass'] = pd.Categorical(df['WeightClass'], categories=WEIGHT_CLASSES, ordered=True)
+
+    df['Year'] = df['EventDate'].dt.to_period('Y')
+    df['Finish'] = finish_flags(df['Method'], df['Round'], df['RoundTime'])
+
+    # Determine first fight on cards
+    position = df.CardPosition.str.split(' of ')
+    df['TotalFights'] = position.str[1].astype(int)
+    df['CardPosition'] = position.str[0].astype(int)
+    df['FirstFight'] = df['CardPosition'] == 1
+    return df
+
+
+def load_fights(since=None, three_round_only=False, standard_weight_classes=False):
+    """Load All_Fights.csv prepared for analysis, from the cache when the source has not changed.
+
+    Adds Year, Finish, TotalFights (number of bouts on the card) and FirstFight, and turns CardPosition
+    into an int.
+
+    Parameters
+    ----------
+    since : datetime-like, optional
+        Only keep fights on or after this date.
+    three_round_only : bool, optional
+        Only keep 3 round fights.
+    standard_weight_classes : bool, optional
+        Only keep WEIGHT_CLASSES, as an ordered categorical. Catch weight and open weight bouts are dropped.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    options = {'since': since, 'three_round_only': three_round_only,
+               'standard_weight_classes': standard_weight_classes}
+    return cached('fights', ['All_Fights.csv'], options, lambda: prepare_fights(**options))
+
+
+def prepare_fighters(min_ufc_fights=2):
+    """Read All_Fighters.csv and convert the columns used in the analyses.
+
+    Parameters
+    ----------
+    min_ufc_fights : int, optional
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    df = pd.read_csv(join(get_processed_dir(), 'All_Fighters.csv'),
+                     parse_dates=['LastFightDate', 'NextFightDate', 'DOB'])
+    df = df.drop(df.index[pd.isna(df['LastFightDate'])])
+    df = df.drop(df.index[df.UFCFights < min_ufc_fights])
+    df['stance'] = df['stance'].astype('category')
+    # height is e.g. 5' 11", or -- when unknown
+    feet_inches = df['height'].astype(str).str.extract(r'(\d+)\'\s*(\d+)"?').astype(float)
+    df['height'] = (feet_inches[0] * 12 + feet_inches[1]).fillna(0).astype(int)
+    df['weight'] = pd.to_numeric(df['weight'], errors='coerce')
+    df['reach'] = pd.to_numeric(df['reach'], errors='coerce')
+    df['WinRatio'] = df['W'] / df['TotalFights']
+    return df
+
+
+def load_fighters(min_ufc_fights=2):
+    """Load All_Fighters.csv prepared for analysis, from the cache when the source has not changed.
+
+    Fighters without a UFC fight are dropped, height is converted to inches (0 when unknown),
+    weight and reach are made numeric and WinRatio is added.
+
+    Parameters
+    ----------
+    min_ufc_fights : int, optional
+        Drop fighters with fewer UFC fights.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    options = {'min_ufc_fights': min_ufc_fights}
+    return cached('fighters', ['All_Fighters.csv'], options, lambda: prepare_fighters(**options))
@@ -0,0 +1,335 @@
+import hashlib
+import json
+import pickle
+import re
+import numpy as np
+import pandas as pd
+from os import listdir, getcwd, makedirs, replace
+from os.path import isfile, join, exists, getmtime
+
+from Process_Entire_History import find_weight_class
+
+TEXT_FIELDS = ['details', 'referee', 'method', 'fighter']
+
+# Compact the index once this share of doc ids belongs to replaced or removed events.
+COMPACT_FRACTION = 0.25
+
+COLUMNS = ['EventFile', 'EventName', 'EventDate', 'CardPosition', 'FightCount', 'WeightClass', 'Method',
+           'Round', 'RoundTime', 'Referee', 'Details', 'FighterName1', 'FighterName2']
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens.
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    list of str
+    """
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+class BoutIndex:
+    """Inverted index over the free text of every bout, with columns for structured filters.
+
+    Each bout gets a doc id in the order it is indexed. Posting lists map (field, token) to the sorted doc
+    ids containing the token, for the fields in TEXT_FIELDS. Bouts of an event json whose content changed
+    since it was indexed are marked deleted and indexed again, bouts of a removed json are marked deleted,
+    and deleted doc ids are dropped by compact.
+    """
+
+    def __init__(self):
+        self.docs = {column: [] for column in COLUMNS}
+        self.postings = {}
+        self.deleted = set()
+        # event filename -> (modification time, sha1 of the content, doc ids)
+        self.indexed_events = {}
+        self._arrays = None
+
+    def add_bout(self, bout):
+        """Index one bout.
+
+        Parameters
+        ----------
+        bout : dict
+            values for every column in COLUMNS
+
+        Returns
+        -------
+        int
+            doc id
+        """
+        doc_id = len(self.docs['EventName'])
+        for column in COLUMNS:
+            self.docs[column].append(bout[column])
+        field_text = {'details': bout['Details'],
+                      'referee': bout['Referee'],
+                      'method': bout['Method'],
+                      'fighter': bout['FighterName1'] + ' ' + bout['FighterName2']}
+        for field, text in field_text.items():
+            for token in set(tokenize(text)):
+                self.postings.setdefault((field, token), []).append(doc_id)
+        self._arrays = None
+        return doc_id
+
+    def add_event(self, event_filename, data, mtime, digest):
+        """Index every bout of an event, replacing bouts indexed from an older version of the file.
+
+        Parameters
+        ----------
+        event_filename : str
+        data : dict
+            event as written by Scrape_All_UFCStats.scrape_event
+        mtime : float
+            modification time of the event json
+        digest : str
+            sha1 of the content of the event json
+        """
+        self.remove_event(event_filename)
+        doc_ids = []
+        for fight_idx in range(1, data['FightCount'] + 1):
+            fight = data[str(fight_idx)]
+            doc_ids.append(self.add_bout({'EventFile': event_filename,
+                                          'EventName': data['EventName'],
+                                          'EventDate': data['EventDate'],
+                                          'CardPosition': fight_idx,
+                                          'FightCount': data['FightCount'],
+                                          'WeightClass': find_weight_class(fight['WeightClass']),
+                                          'Method': fight['Method'],
+                                          'Round': fight['Round'],
+                                          'RoundTime': fight['RoundTime'],
+                                          'Referee': fight['Referee'],
+                                          'Details': fight['Details'],
+                                          'FighterName1': fight['Fighter_1']['Name'],
+                                          'FighterName2': fight['Fighter_2']['Name']}))
+        self.indexed_events[event_filename] = (mtime, digest, doc_ids)
+
+    def remove_event(self, event_filename):
+        """Mark every bout of an event deleted.
+
+        Parameters
+        ----------
+        event_filename : str
+        """
+        if event_filename in self.indexed_events:
+            self.deleted.update(self.indexed_events.pop(event_filename)[2])
+            self._arrays = None
+
+    def compact(self):
+        """Drop deleted bouts, renumbering the remaining doc ids in the same order."""
+        keep = np.ones(len(self.docs['EventName']), dtype=bool)
+        keep[list(self.deleted)] = False
+        new_ids = np.cumsum(keep) - 1
+        self.docs = {column: [value for value, kept in zip(values, keep) if kept]
+                     for column, values in self.docs.items()}
+        postings = {}
+        for key, posting in self.postings.items():
+            posting = np.asarray(posting, dtype=np.int64)
+            posting = posting[keep[posting]]
+            if len(posting):
+                postings[key] = new_ids[posting].tolist()
+        self.postings = postings
+        self.indexed_events = {event_filename: (mtime, digest, new_ids[doc_ids].tolist())
+                               for event_filename, (mtime, digest, doc_ids) in self.indexed_events.items()}
+        self.deleted = set()
+        self._arrays = None
+
+    def update(self, all_events_dir=None):
+        """Index event jsons that are new or changed since the last update and drop removed ones.
+
+        Files whose modification time changed are only indexed again if their content changed too, so
+        re-scraping unchanged events does not grow the index. The index is compacted once deleted bouts
+        make up COMPACT_FRACTION of it.
+
+        Parameters
+        ----------
+        all_events_dir : str, optional
+
+        Returns
+        -------
+        int
+            number of events whose entry changed, i.e. indexed, removed or re-stamped
+        """
+        if all_events_dir is None:
+            all_events_dir = getcwd() + '/UFCStats_Dicts/All_Events/'
+        only_files = [f for f in listdir(all_events_dir) if isfile(join(all_events_dir, f)) and not f.startswith('.')]
+        changed = 0
+        for event_filename in set(self.indexed_events) - set(only_files):
+            self.remove_event(event_filename)
+            changed += 1
+        for event_filename in sorted(only_files):
+            mtime = getmtime(join(all_events_dir, event_filename))
+            indexed = self.indexed_events.get(event_filename)
+            if indexed is not None and indexed[0] == mtime:
+                continue
+            with open(join(all_events_dir, event_filename), 'rb') as json_file:
+                content = json_file.read()
+            digest = hashlib.sha1(content).hexdigest()
+            if indexed is not None and indexed[1] == digest:
+                self.indexed_events[event_filename] = (mtime, digest, indexed[2])
+            else:
+                self.add_event(event_filename, json.loads(content), mtime, digest)
+            changed += 1
+        if len(self.deleted) > COMPACT_FRACTION * len(self.docs['EventName']):
+            self.compact()
+        return changed
+
+    def arrays(self):
+        """Numpy columns used by the structured filters, rebuilt only after new bouts are indexed.
+
+        Returns
+        -------
+        dict of numpy.ndarray
+        """
+        if self._arrays is None:
+            live = np.ones(len(self.docs['EventName']), dtype=bool)
+            live[list(self.deleted)] = False
+            self._arrays = {'live': live,
+                            'EventDate': pd.to_datetime(pd.Series(self.docs['EventDate'])).to_numpy(),
+                            'CardPosition': np.array(self.docs['CardPosition'], dtype=np.int64),
+                            'Round': pd.to_numeric(pd.Series(self.docs['Round']), errors='coerce').to_numpy(),
+                            'WeightClass': np.array(self.docs['WeightClass'], dtype=object)}
+        return self._arrays
+
+    def match(self, field, text):
+        """Doc ids whose field contains every token of text.
+
+        Parameters
+        ----------
+        field : str
+            one of TEXT_FIELDS
+        text : str
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        result = None
+        # intersect the shortest posting lists first
+        postings = sorted((self.postings.get((field, token), []) for token in tokenize(text)), key=len)
+        for posting in postings:
+            posting = np.asarray(posting, dtype=np.int64)
+            result = posting if result is None else np.intersect1d(result, posting, assume_unique=True)
+            if not len(result):
+                break
+        if result is None:
+            return np.arange(len(self.docs['EventName']))
+        return result
+
+    def search(self, details=None, referee=None, method=None, fighter=None, weight_class=None, start=None,
+               end=None, card_position=None, round_seen=None):
+        """Find bouts matching every given condition.
+
+        Text conditions match bouts containing all of their tokens, in any order, e.g.
+        search(details='arm triangle', round_seen=1).
+
+        Parameters
+        ----------
+        details : str, optional
+            e.g. 'Rear Naked Choke' or judges' scores
+        referee : str, optional
+        method : str, optional
+        fighter : str, optional
+            either fighter's name
+        weight_class : str or list of str, optional
+            as returned by find_weight_class
+        start : datetime-like, optional
+            first event date, inclusive
+        end : datetime-like, optional
+            last event date, inclusive
+        card_position : int or list of int, optional
+            1 is the first fight of the night
+        round_seen : int or list of int, optional
+            round the bout ended in
+
+        Returns
+        -------
+        pandas.DataFrame
+            matching bouts in the order they were indexed
+        """
+        doc_ids = None
+        for field, text in zip(TEXT_FIELDS, [details, referee, method, fighter]):
+            if text is not None:
+                matched = self.match(field, text)
+                doc_ids = matched if doc_ids is None else np.intersect1d(doc_ids, matched, assume_unique=True)
+        if doc_ids is None:
+            doc_ids = np.arange(len(self.docs['EventName']))
+
+        arrays = self.arrays()
+        keep = arrays['live'][doc_ids]
+        if weight_class is not None:
+            keep &= np.isin(arrays['WeightClass'][doc_ids], np.atleast_1d(weight_class))
+        if start is not None:
+            keep &= arrays['EventDate'][doc_ids] >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            keep &= arrays['EventDate'][doc_ids] <= np.datetime64(pd.Timestamp(end))
+        if card_position is not None:
+            keep &= np.isin(arrays['CardPosition'][doc_ids], np.atleast_1d(card_position))
+        if round_seen is not None:
+            keep &= np.isin(arrays['Round'][doc_ids], np.atleast_1d(round_seen))
+        doc_ids = doc_ids[keep]
+
+        df = pd.DataFrame({column: [self.docs[column][i] for i in doc_ids] for column in COLUMNS}, index=doc_ids)
+        df['EventDate'] = pd.to_datetime(df['EventDate'])
+        return df
+
+    def save(self, path):
+        """Pickle the index as plain dicts, so it loads whatever module BoutIndex was run from.
+
+        Parameters
+        ----------
+        path : str
+        """
+        state = {'docs': self.docs, 'postings': self.postings, 'deleted': self.deleted,
+                 'indexed_events': self.indexed_events}
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save.
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        BoutIndex
+        """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        index = cls()
+        for key in ['docs', 'postings', 'deleted', 'indexed_events']:
+            setattr(index, key, state[key])
+        return index
+
+
+def load_bout_index(update=True):
+    """Load the saved bout index, updating it from the event jsons and saving it again if anything changed.
+
+    Parameters
+    ----------
+    update : bool, optional
+
+    Returns
+    -------
+    BoutIndex
+    """
+    index_dir = getcwd() + '/UFCStats_Dicts/Index/'
+    if not exists(index_dir):
+        makedirs(index_dir)
+    index_path = join(index_dir, 'bout_index.pkl')
+    index = BoutIndex.load(index_path) if exists(index_path) else BoutIndex()
+    if update and index.update():
+        index.save(index_path)
+    return index
+
+
+if __name__ == '__main__':
+    bout_index = load_bout_index()
+    print(len(bout_index.docs['EventName']) - len(bout_index.deleted), 'bouts indexed')
@@ -0,0 +1,344 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from os import listdir, getcwd, makedirs, utime
+from os.path import isfile, join, exists, getmtime
+from time import time
+
+import Scrape_All_Career_UFCStats
+
+RATE_FIELDS = ['SLpM', 'StrAcc', 'SApM', 'StrDef', 'TDAvg', 'TDAcc', 'TDDef', 'SubAvg']
+
+SUM_COLUMNS = ['SigStrLanded', 'SigStrAttempted', 'OppSigStrLanded', 'OppSigStrAttempted',
+               'TDLanded', 'TDAttempted', 'OppTDLanded', 'OppTDAttempted', 'SubAtt', 'Seconds']
+
+
+def split_landed_attempted(stat):
+    """Split an 'x of y' stat into landed and attempted.
+
+    Parameters
+    ----------
+    stat : str
+        e.g. '45 of 102'. Missing stats are '---'.
+
+    Returns
+    -------
+    tuple of float
+        (nan, nan) if the stat is missing
+    """
+    parts = stat.split(' of ')
+    if len(parts) != 2:
+        return np.nan, np.nan
+    return float(parts[0]), float(parts[1])
+
+
+def fight_seconds(round_seen, round_time, round_format):
+    """Total fight time in seconds from the round and time the fight ended.
+
+    Parameters
+    ----------
+    round_seen : str
+        round the fight ended, e.g. '3'
+    round_time : str
+        time in the round the fight ended, e.g. '5:00'
+    round_format : str
+        e.g. '3 Rnd (5-5-5)' or '1 Rnd + OT (12-3)'. Five minute rounds are assumed if no round lengths
+        are listed, e.g. 'No Time Limit'.
+
+    Returns
+    -------
+    float
+    """
+    minutes, seconds = round_time.split(':')
+    elapsed = int(minutes) * 60 + int(seconds)
+    completed_rounds = int(round_seen) - 1
+    if '(' in round_format:
+        lengths = [int(m) for m in round_format.split('(')[1].strip(')').split('-')]
+        lengths += [5] * max(0, completed_rounds - len(lengths))
+    else:
+        lengths = [5] * completed_rounds
+    return float(sum(lengths[:completed_rounds]) * 60 + elapsed)
+
+
+def load_fighter_bouts():
+    """Load event jsons into one row per fighter per bout.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Sorted by EventDate. Strike and takedown columns are nan for older bouts without stats.
+    """
+    all_events_dir = getcwd() + '/UFCStats_Dicts/All_Events/'
+    only_files = [f for f in listdir(all_events_dir) if isfile(join(all_events_dir, f)) and not f.startswith('.')]
+
+    rows = []
+    for event_filename in only_files:
+        with open(join(all_events_dir, event_filename)) as json_file:
+            data = json.load(json_file)
+        for fight_idx in range(1, data['FightCount'] + 1):
+            fight = data[str(fight_idx)]
+            seconds = fight_seconds(fight['Round'], fight['RoundTime'], fight['RoundFormat'])
+            for own, opp in [('Fighter_1', 'Fighter_2'), ('Fighter_2', 'Fighter_1')]:
+                fighter = fight[own]
+                opponent = fight[opp]
+                sig_landed, sig_attempted = split_landed_attempted(fighter['SigStr'])
+                opp_sig_landed, opp_sig_attempted = split_landed_attempted(opponent['SigStr'])
+                td_landed, td_attempted = split_landed_attempted(fighter['TD'])
+                opp_td_landed, opp_td_attempted = split_landed_attempted(opponent['TD'])
+                rows.append({'FighterLink': fighter['UFCStats_Link'],
+                             'FighterName': fighter['Name'],
+                             'EventName': data['EventName'],
+                             'EventDate': data['EventDate'],
+                             'Outcome': fighter['Outcome'],
+                             'Method': fight['Method'],
+                             'SigStrLanded': sig_landed,
+                             'SigStrAttempted': sig_attempted,
+                             'OppSigStrLanded': opp_sig_landed,
+                             'OppSigStrAttempted': opp_sig_attempted,
+                             'TDLanded': td_landed,
+                             'TDAttempted': td_attempted,
+                             'OppTDLanded': opp_td_landed,
+                             'OppTDAttempted': opp_td_attempted,
+                             'SubAtt': pd.to_numeric(fighter['SubAtt'], errors='coerce'),
+                             'Seconds': seconds})
+
+    df = pd.DataFrame(rows)
+    df['EventDate'] = pd.to_datetime(df['EventDate'])
+    df.sort_values(by='EventDate', inplace=True, kind='stable', ignore_index=True)
+    return df
+
+
+def compute_rates(totals):
+    """Compute the career rates shown on UFCStats fighter pages from summed bout stats.
+
+    Parameters
+    ----------
+    totals : pandas.DataFrame
+        SUM_COLUMNS summed over the bouts of interest
+
+    Returns
+    -------
+    pandas.DataFrame
+        RATE_FIELDS, rounded like the fighter page. Percentages are in 0-100.
+    """
+    minutes = totals['Seconds'] / 60
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = pd.DataFrame({
+            'SLpM': totals['SigStrLanded'] / minutes,
+            'StrAcc': 100 * totals['SigStrLanded'] / totals['SigStrAttempted'],
+            'SApM': totals['OppSigStrLanded'] / minutes,
+            'StrDef': 100 * (1 - totals['OppSigStrLanded'] / totals['OppSigStrAttempted']),
+            'TDAvg': 15 * totals['TDLanded'] / minutes,
+            'TDAcc': 100 * totals['TDLanded'] / totals['TDAttempted'],
+            'TDDef': 100 * (1 - totals['OppTDLanded'] / totals['OppTDAttempted']),
+            'SubAvg': 15 * totals['SubAtt'] / minutes}, index=totals.index)
+    # fighter pages show 0 rather than nothing when there were no attempts
+    rates = rates.replace([np.inf, -np.inf], np.nan).fillna(0)
+    rates[['SLpM', 'SApM', 'TDAvg', 'SubAvg']] = rates[['SLpM', 'SApM', 'TDAvg', 'SubAvg']].round(2)
+    rates[['StrAcc', 'StrDef', 'TDAcc', 'TDDef']] = rates[['StrAcc', 'StrDef', 'TDAcc', 'TDDef']].round(0)
+    return rates
+
+
+def stat_totals(fighter_bouts):
+    """Zero out bouts without stats so they count toward UFCFights but not toward rates.
+
+    Parameters
+    ----------
+    fighter_bouts : pandas.DataFrame
+        output of load_fighter_bouts
+
+    Returns
+    -------
+    pandas.DataFrame
+        SUM_COLUMNS with bouts lacking stats set to 0
+    """
+    totals = fighter_bouts[SUM_COLUMNS].copy()
+    has_stats = totals['SigStrAttempted'].notna()
+    totals.loc[~has_stats, :] = 0
+    return totals.fillna(0)
+
+
+def career_aggregates(fighter_bouts, as_of=None):
+    """Career rates of every fighter from bouts before a date.
+
+    Parameters
+    ----------
+    fighter_bouts : pandas.DataFrame
+        output of load_fighter_bouts
+    as_of : datetime-like, optional
+        Only bouts strictly before this date count. All bouts count if None.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by FighterLink, with RATE_FIELDS, UFCFights and LastFightDate
+    """
+    df = fighter_bouts
+    if as_of is not None:
+        df = df[df['EventDate'] < pd.Timestamp(as_of)]
+    totals = stat_totals(df)
+    totals['FighterLink'] = df['FighterLink']
+    grouped = totals.groupby('FighterLink')
+    agg = compute_rates(grouped[SUM_COLUMNS].sum())
+    agg['UFCFights'] = grouped.size()
+    agg['LastFightDate'] = df.groupby('FighterLink')['EventDate'].max()
+    return agg
+
+
+def pre_fight_aggregates(fighter_bouts):
+    """Career rates of each fighter going into each of their bouts.
+
+    Parameters
+    ----------
+    fighter_bouts : pandas.DataFrame
+        output of load_fighter_bouts
+
+    Returns
+    -------
+    pandas.DataFrame
+        fighter_bouts with RATE_FIELDS and PrevUFCFights from earlier bouts only
+    """
+    totals = stat_totals(fighter_bouts)
+    prior = totals.groupby(fighter_bouts['FighterLink']).cumsum() - totals
+    df = fighter_bouts.copy()
+    df[RATE_FIELDS] = compute_rates(prior)
+    df['PrevUFCFights'] = df.groupby('FighterLink').cumcount()
+    return df
+
+
+def max_age_days(fighter_link, refresh_days, jitter=0.5):
+    """Age at which the stored page of a fighter is refreshed, spread per fighter id.
+
+    Fighters scraped on the same day would otherwise all expire together and be fetched in one burst.
+
+    Parameters
+    ----------
+    fighter_link : str
+    refresh_days : float
+    jitter : float, optional
+        fraction of refresh_days by which the age can be shortened
+
+    Returns
+    -------
+    float
+        between (1 - jitter) * refresh_days and refresh_days, the same for every call with the same fighter
+    """
+    digest = hashlib.sha1(fighter_link.split('/')[-1].encode()).hexdigest()
+    return refresh_days * (1 - jitter * int(digest[:8], 16) / 16 ** 8)
+
+
+def add_later_results(fighter_stats, fighter_bouts):
+    """Bring the pro record of a stored fighter page up to date with the UFC bouts fought after it.
+
+    The page lists UFC bouts up to its LastFightDate, so later bouts are added to W, L, D, NC and
+    TotalFights. Bouts outside the UFC since the page was fetched are only picked up by a refresh.
+
+    Parameters
+    ----------
+    fighter_stats : dict
+        FighterStats of the stored page
+    fighter_bouts : pandas.DataFrame
+        rows of load_fighter_bouts for the fighter
+
+    Returns
+    -------
+    dict
+        copy of fighter_stats with the record updated
+    """
+    fighter_stats = dict(fighter_stats)
+    page_last_fight = pd.to_datetime(fighter_stats['LastFightDate'], format='%b. %d, %Y', errors='coerce')
+    later = fighter_bouts
+    if not pd.isna(page_last_fight):
+        later = fighter_bouts[fighter_bouts['EventDate'] > page_last_fight]
+    counts = later['Outcome'].value_counts()
+    for field in ['W', 'L', 'D', 'NC']:
+        fighter_stats[field] += int(counts.get(field, 0))
+        fighter_stats['TotalFights'] += int(counts.get(field, 0))
+    return fighter_stats
+
+
+def get_static_profile(fighter_link, static_dir, refresh_days, seed_path=None):
+    """Load the static fields of a fighter, fetching the fighter page only if the stored copy is too old.
+
+    Parameters
+    ----------
+    fighter_link : str
+    static_dir : str
+        directory of stored fighter pages, one json per fighter id
+    refresh_days : float
+    seed_path : str, optional
+        existing All_Fighters json of the fighter, copied in as the stored page when there is none yet,
+        keeping its age
+
+    Returns
+    -------
+    dict
+        FighterStats as returned by parse_ufcstats_fighter
+    """
+    static_path = join(static_dir, fighter_link.split('/')[-1] + '.json')
+    if not exists(static_path) and seed_path is not None:
+        with open(seed_path) as json_file:
+            f_dict = json.load(json_file)
+        Scrape_All_Career_UFCStats.write_fighter_json(f_dict, static_dir, fighter_link.split('/')[-1] + '.json')
+        seed_mtime = getmtime(seed_path)
+        utime(static_path, (seed_mtime, seed_mtime))
+    if exists(static_path) and time() - getmtime(static_path) < max_age_days(fighter_link, refresh_days) * 24 * 3600:
+        with open(static_path) as json_file:
+            return json.load(json_file)['FighterStats']
+    _, f_dict = Scrape_All_Career_UFCStats.scrape_fighter(fighter_link)
+    Scrape_All_Career_UFCStats.write_fighter_json(f_dict, static_dir, fighter_link.split('/')[-1] + '.json')
+    return f_dict['FighterStats']
+
+
+def build_fighter_jsons(refresh_days=180):
+    """Write All_Fighters/ from event data, fetching fighter pages only for static fields.
+
+    Career rates, UFCFights and LastFightDate are computed from the event jsons. Height, reach, stance,
+    DOB and the pro record come from the fighter page, which is fetched only for new fighters or when
+    the stored copy is older than refresh_days. UFC results after the stored page are added to its pro
+    record, and a NextFightDate that has already passed is cleared. Stored copies start from the existing All_Fighters/ jsons, and their refreshes are spread over the
+    second half of refresh_days.
+
+    Parameters
+    ----------
+    refresh_days : float, optional
+        Age in days after which a stored fighter page is fetched again.
+
+    Returns
+    -------
+    None
+    """
+    stat_dir = getcwd() + '/UFCStats_Dicts/'
+    save_dir = join(stat_dir, 'All_Fighters/')
+    static_dir = join(stat_dir, 'Static_Fighters/')
+    for d in [save_dir, static_dir]:
+        if not exists(d):
+            makedirs(d)
+
+    # existing fighter jsons are named <name>_<fighter id>.json
+    existing = {f.rsplit('_', 1)[-1][:-len('.json')]: join(save_dir, f) for f in listdir(save_dir)
+                if isfile(join(save_dir, f)) and f.endswith('.json')}
+
+    fighter_bouts = load_fighter_bouts()
+    bout_positions = fighter_bouts.groupby('FighterLink').indices
+    agg = career_aggregates(fighter_bouts)
+    for fighter_link, row in agg.iterrows():
+        stats = get_static_profile(fighter_link, static_dir, refresh_days,
+                                   seed_path=existing.get(fighter_link.split('/')[-1]))
+        fighter_stats = add_later_results(stats, fighter_bouts.iloc[bout_positions[fighter_link]])
+        fighter_stats['LastFightDate'] = row['LastFightDate'].strftime('%b. %d, %Y')
+        next_fight = pd.to_datetime(fighter_stats['NextFightDate'], format='%b. %d, %Y', errors='coerce')
+        if not pd.isna(next_fight) and next_fight <= row['LastFightDate']:
+            fighter_stats['NextFightDate'] = ''
+        fighter_stats['UFCFights'] = int(row['UFCFights'])
+        for field in ['SLpM', 'SApM', 'TDAvg', 'SubAvg']:
+            fighter_stats[field] = '{:.2f}'.format(row[field])
+        for field in ['StrAcc', 'StrDef', 'TDAcc', 'TDDef']:
+            fighter_stats[field] = str(int(row[field]))
+        filename = stats['FighterName'].replace(' ', '_') + '_' + fighter_link.split('/')[-1] + '.json'
+        Scrape_All_Career_UFCStats.write_fighter_json({'FighterStats': fighter_stats}, save_dir, filename)
+
+
+if __name__ == '__main__':
+    build_fighter_jsons()
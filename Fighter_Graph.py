@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+from os import getcwd, makedirs
+from os.path import join, exists
+
+from Fighter_Ratings import OUTCOME_SCORES, to_day
+from Process_Entire_History import load_all_fights
+
+
+class FighterGraph:
+    """Opponent graph of every fighter, stored as a compressed sparse row (CSR) adjacency.
+
+    Fighters are identified by their UFCStats link, since different fighters can share a name; names are
+    only kept as labels, the latest one seen for each link.
+
+    Each bout adds an edge in both directions. Edge attributes are the day of the bout (days since
+    1970-01-01), the score of the source fighter (1 win, 0 loss, 0.5 draw, nan no contest) and the method
+    as an index into methods. Appended bouts are kept in a small edge list and merged into the CSR
+    arrays the next time a query needs them, sorting only the appended edges.
+    """
+
+    def __init__(self):
+        self.links = []
+        self.names = []
+        self.index = {}
+        self.methods = []
+        self.method_index = {}
+        self.events = set()
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int64)
+        self.edge_day = np.empty(0, dtype=np.int64)
+        self.edge_score = np.empty(0)
+        self.edge_method = np.empty(0, dtype=np.int64)
+        self.pending = []
+
+    def _ids(self, values, index, names):
+        ids = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            idx = index.get(value)
+            if idx is None:
+                idx = len(names)
+                names.append(value)
+                index[value] = idx
+            ids[i] = idx
+        return ids
+
+    def append(self, fights):
+        """Add bouts of events not in the graph yet, without rebuilding the adjacency.
+
+        Parameters
+        ----------
+        fights : pandas.DataFrame
+            rows in the format of All_Fights.csv
+
+        Returns
+        -------
+        int
+            number of bouts added
+        """
+        df = fights[~fights['EventName'].isin(self.events)]
+        if not len(df):
+            return 0
+        id_1 = self._ids(df['FighterLink1'].tolist(), self.index, self.links)
+        id_2 = self._ids(df['FighterLink2'].tolist(), self.index, self.links)
+        self.names.extend([''] * (len(self.links) - len(self.names)))
+        for i, name in zip(np.concatenate([id_1, id_2]), df['FighterName1'].tolist() + df['FighterName2'].tolist()):
+            self.names[i] = name
+        method = self._ids(df['Method'].fillna('').tolist(), self.method_index, self.methods)
+        day = to_day(df['EventDate'])
+        score_1 = df['FighterOutcome1'].map(OUTCOME_SCORES).to_numpy(dtype=float)
+        score_2 = df['FighterOutcome2'].map(OUTCOME_SCORES).to_numpy(dtype=float)
+        self.pending.append((np.concatenate([id_1, id_2]), np.concatenate([id_2, id_1]),
+                             np.concatenate([day, day]), np.concatenate([score_1, score_2]),
+                             np.concatenate([method, method])))
+        self.events.update(df['EventName'].unique())
+        return len(df)
+
+    def compact(self):
+        """Merge appended bouts into the CSR arrays.
+
+        Returns
+        -------
+        FighterGraph
+            self, so queries can chain on it
+        """
+        if not self.pending:
+            return self
+        n = len(self.links)
+        old_src = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        src, dst, day, score, method = [np.concatenate(column) for column in zip(*self.pending)]
+        # edges of each fighter are contiguous and in date order
+        order = np.lexsort((day, src))
+        src, dst, day, score, method = src[order], dst[order], day[order], score[order], method[order]
+        # slot of each appended edge in the merged arrays, after existing edges of the same fighter and day
+        pos = np.searchsorted((old_src << 32) + self.edge_day, (src << 32) + day, side='right') + np.arange(len(src))
+        is_new = np.zeros(len(self.indices) + len(src), dtype=bool)
+        is_new[pos] = True
+        for key, new in zip(['indices', 'edge_day', 'edge_score', 'edge_method'], [dst, day, score, method]):
+            merged = np.empty(len(is_new), dtype=getattr(self, key).dtype)
+            merged[pos] = new
+            merged[~is_new] = getattr(self, key)
+            setattr(self, key, merged)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(np.concatenate([old_src, src]), minlength=n), out=self.indptr[1:])
+        self.pending = []
+        return self
+
+    def fighter_id(self, link):
+        """Id of a fighter in the graph.
+
+        Parameters
+        ----------
+        link : str
+            UFCStats fighter link
+
+        Returns
+        -------
+        int
+        """
+        if link not in self.index:
+            raise KeyError('Unknown fighter: ' + link)
+        return self.index[link]
+
+    def find_links(self, name):
+        """Links of every fighter in the graph with a name.
+
+        Parameters
+        ----------
+        name : str
+
+        Returns
+        -------
+        list of str
+        """
+        return [link for link, label in zip(self.links, self.names) if label == name]
+
+    def opponents(self, link):
+        """Every bout of a fighter, in date order.
+
+        Parameters
+        ----------
+        link : str
+
+        Returns
+        -------
+        pandas.DataFrame
+            OpponentLink, Opponent (name), EventDate, Score and Method
+        """
+        self.compact()
+        i = self.fighter_id(link)
+        edges = slice(self.indptr[i], self.indptr[i + 1])
+        return pd.DataFrame({'OpponentLink': np.array(self.links, dtype=object)[self.indices[edges]],
+                             'Opponent': np.array(self.names, dtype=object)[self.indices[edges]],
+                             'EventDate': pd.to_datetime(self.edge_day[edges], unit='D'),
+                             'Score': self.edge_score[edges],
+                             'Method': np.array(self.methods, dtype=object)[self.edge_method[edges]]})
+
+    def common_opponents(self, link_1, link_2):
+        """Fighters who have fought both fighters.
+
+        Parameters
+        ----------
+        link_1 : str
+        link_2 : str
+
+        Returns
+        -------
+        list of str
+            links of the common opponents
+        """
+        self.compact()
+        i, j = self.fighter_id(link_1), self.fighter_id(link_2)
+        common = np.intersect1d(self.indices[self.indptr[i]:self.indptr[i + 1]],
+                                self.indices[self.indptr[j]:self.indptr[j + 1]])
+        return [self.links[k] for k in common]
+
+    def shortest_path(self, link_1, link_2, max_hops=6):
+        """Shortest chain of opponents connecting two fighters, by breadth-first search.
+
+        Parameters
+        ----------
+        link_1 : str
+        link_2 : str
+        max_hops : int, optional
+
+        Returns
+        -------
+        list of str or None
+            links of the fighters from link_1 to link_2, None if not connected within max_hops
+        """
+        self.compact()
+        source, target = self.fighter_id(link_1), self.fighter_id(link_2)
+        parent = np.full(len(self.links), -1, dtype=np.int64)
+        parent[source] = source
+        frontier = np.array([source])
+        for _ in range(max_hops):
+            if parent[target] >= 0 or not len(frontier):
+                break
+            # gather the edges of every fighter in the frontier at once
+            starts, counts = self.indptr[frontier], np.diff(self.indptr)[frontier]
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            edge_idx = np.repeat(starts, counts) + offsets
+            src, dst = np.repeat(frontier, counts), self.indices[edge_idx]
+            unseen = parent[dst] < 0
+            dst, first = np.unique(dst[unseen], return_index=True)
+            parent[dst] = src[unseen][first]
+            frontier = dst
+        if parent[target] < 0:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(parent[path[-1]])
+        return [self.links[k] for k in reversed(path)]
+
+    def strength_of_schedule(self, as_of=None):
+        """Win ratio of every fighter and of the opponents they faced.
+
+        Parameters
+        ----------
+        as_of : datetime-like, optional
+            Only bouts strictly before this date count.
+
+        Returns
+        -------
+        pandas.DataFrame
+            indexed by FighterLink, with FighterName, Fights, WinRatio, OppWinRatio (mean win ratio of opponents),
+            OppOppWinRatio (mean OppWinRatio of opponents) and SOS = (2 * OppWinRatio + OppOppWinRatio) / 3.
+            No contests count as fights but not toward win ratios.
+        """
+        self.compact()
+        n = len(self.links)
+        src = np.repeat(np.arange(n), np.diff(self.indptr))
+        dst, score = self.indices, self.edge_score
+        if as_of is not None:
+            keep = self.edge_day < to_day(as_of)
+            src, dst, score = src[keep], dst[keep], score[keep]
+        decided = ~np.isnan(score)
+        fights = np.bincount(src, minlength=n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            win_ratio = (np.bincount(src[decided], weights=score[decided], minlength=n)
+                         / np.bincount(src[decided], minlength=n))
+            opp_win_ratio = np.bincount(src, weights=np.nan_to_num(win_ratio[dst]), minlength=n) / fights
+            opp_opp_win_ratio = np.bincount(src, weights=np.nan_to_num(opp_win_ratio[dst]), minlength=n) / fights
+        df = pd.DataFrame({'FighterName': self.names,
+                           'Fights': fights,
+                           'WinRatio': win_ratio,
+                           'OppWinRatio': opp_win_ratio,
+                           'OppOppWinRatio': opp_opp_win_ratio},
+                          index=pd.Index(self.links, name='FighterLink'))
+        df['SOS'] = (2 * df['OppWinRatio'] + df['OppOppWinRatio']) / 3
+        return df[df['Fights'] > 0]
+
+    def save(self, path):
+        """Save the graph to a .npz file.
+
+        Parameters
+        ----------
+        path : str
+        """
+        self.compact()
+        np.savez_compressed(path, links=np.array(self.links, dtype=str), names=np.array(self.names, dtype=str),
+                            methods=np.array(self.methods, dtype=str),
+                            events=np.array(sorted(self.events), dtype=str), indptr=self.indptr,
+                            indices=self.indices, edge_day=self.edge_day, edge_score=self.edge_score,
+                            edge_method=self.edge_method)
+
+    @classmethod
+    def load(cls, path):
+        """Load a graph saved with save.
+
+        Graphs saved before fighters were keyed by link come back empty, so they are rebuilt.
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        FighterGraph
+        """
+        graph = cls()
+        with np.load(path) as data:
+            if 'links' not in data:
+                return graph
+            graph.links = data['links'].tolist()
+            graph.index = {link: i for i, link in enumerate(graph.links)}
+            graph.names = data['names'].tolist()
+            graph.methods = data['methods'].tolist()
+            graph.method_index = {method: i for i, method in enumerate(graph.methods)}
+            graph.events = set(data['events'].tolist())
+            for key in ['indptr', 'indices', 'edge_day', 'edge_score', 'edge_method']:
+                setattr(graph, key, data[key].copy())
+        return graph
+
+
+def update_fighter_graph():
+    """Load the saved graph and append events from All_Fights.csv that it does not have yet.
+
+    Returns
+    -------
+    FighterGraph
+    """
+    graph_dir = getcwd() + '/UFCStats_Dicts/Graph/'
+    if not exists(graph_dir):
+        makedirs(graph_dir)
+    graph_path = join(graph_dir, 'fighter_graph.npz')
+
+    graph = FighterGraph.load(graph_path) if exists(graph_path) else FighterGraph()
+    added = graph.append(load_all_fights())
+    print('Added', added, 'bouts to the fighter graph')
+    if added:
+        graph.save(graph_path)
+    return graph
+
+
+if __name__ == '__main__':
+    update_fighter_graph()
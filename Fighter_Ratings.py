@@ -0,0 +1,442 @@
+import json
+import numpy as np
+import pandas as pd
+from os import getcwd, makedirs
+from os.path import join, exists
+
+from Process_Entire_History import load_all_fights
+
+# Multipliers on the rating update, so a finish moves ratings more than a split decision.
+DEFAULT_FINISH_WEIGHTS = {'KO/TKO': 1.25, 'Submission': 1.25, 'TKO - Doctor\'s Stoppage': 1.1,
+                          'Decision - Unanimous': 1.0, 'Decision - Majority': 0.9, 'Decision - Split': 0.8,
+                          'DQ': 0.5, 'Could Not Continue': 0.5, 'Overturned': 0.5}
+
+OUTCOME_SCORES = {'W': 1.0, 'L': 0.0, 'D': 0.5}
+
+GLICKO_Q = np.log(10) / 400
+
+
+def glicko_g(rd):
+    """Glicko attenuation factor for an opponent's rating deviation.
+
+    Parameters
+    ----------
+    rd : float or numpy.ndarray
+
+    Returns
+    -------
+    float or numpy.ndarray
+    """
+    return 1 / np.sqrt(1 + 3 * GLICKO_Q ** 2 * rd ** 2 / np.pi ** 2)
+
+
+def to_day(dates):
+    """Convert dates to integer days since 1970-01-01.
+
+    Parameters
+    ----------
+    dates : str, datetime-like or array-like of those
+
+    Returns
+    -------
+    numpy.int64 or numpy.ndarray of numpy.int64
+    """
+    return np.asarray(pd.to_datetime(dates), dtype='datetime64[D]').astype(np.int64)
+
+
+def bout_keys(fights):
+    """Key identifying each bout, from the event and the links of both fighters.
+
+    Parameters
+    ----------
+    fights : pandas.DataFrame
+        rows in the format of All_Fights.csv
+
+    Returns
+    -------
+    pandas.Series of str
+    """
+    return fights['EventName'] + '|' + fights['FighterLink1'] + '|' + fights['FighterLink2']
+
+
+class RatingEngine:
+    """Elo or Glicko ratings for every fighter, updated one bout at a time in date order.
+
+    Per-fighter state is held in numpy arrays indexed by fighter id, and every rating change is
+    appended to a history so the rating of any fighter can be looked up as of any date. Fighters are
+    identified by their UFCStats link, since different fighters can share a name; names are only kept as
+    labels, the latest one seen for each link.
+
+    Parameters
+    ----------
+    system : str, optional
+        'elo' or 'glicko'
+    k : float, optional
+        Elo K factor. Ignored for Glicko.
+    finish_weights : dict or None, optional
+        Multiplier on the rating update for each Method. Methods not listed use 1.0.
+        Pass None to weight every bout the same.
+    initial_rating : float, optional
+    initial_rd : float, optional
+        Glicko rating deviation of a fighter with no bouts, and the ceiling on deviation.
+    c : float, optional
+        Glicko growth of the rating deviation per rating period of inactivity.
+    period_days : float, optional
+        Length of a Glicko rating period in days.
+    """
+
+    def __init__(self, system='elo', k=32.0, finish_weights=None, initial_rating=1500.0, initial_rd=350.0,
+                 c=35.0, period_days=30.0):
+        if system not in ('elo', 'glicko'):
+            raise ValueError("system must be 'elo' or 'glicko'")
+        self.params = {'system': system, 'k': k, 'finish_weights': finish_weights,
+                       'initial_rating': initial_rating, 'initial_rd': initial_rd,
+                       'c': c, 'period_days': period_days}
+        self.links = []
+        self.names = []
+        self.index = {}
+        self.rating = np.empty(0)
+        self.rd = np.empty(0)
+        self.last_day = np.empty(0, dtype=np.int64)
+        self.fights = np.empty(0, dtype=np.int32)
+        self.hist_fighter = np.empty(0, dtype=np.int32)
+        self.hist_day = np.empty(0, dtype=np.int64)
+        self.hist_rating = np.empty(0)
+        self.hist_rd = np.empty(0)
+        self.n_hist = 0
+        # Most recent day rated, and the key of every bout ingested so far, so no bout is counted twice
+        # and bouts backfilled before processed_day are noticed.
+        self.processed_day = np.iinfo(np.int64).min
+        self.seen_keys = set()
+        self._hist_order = None
+
+    def fighter_id(self, link, name=None):
+        """Return the id of a fighter, adding the fighter with initial ratings if unseen.
+
+        Parameters
+        ----------
+        link : str
+            UFCStats fighter link
+        name : str, optional
+            label of the fighter, replacing the previous one if given
+
+        Returns
+        -------
+        int
+        """
+        idx = self.index.get(link)
+        if idx is None:
+            idx = len(self.links)
+            self.links.append(link)
+            self.names.append(link if name is None else name)
+            self.index[link] = idx
+            if idx == len(self.rating):
+                size = max(16, 2 * len(self.rating))
+                self.rating = np.resize(self.rating, size)
+                self.rd = np.resize(self.rd, size)
+                self.last_day = np.resize(self.last_day, size)
+                self.fights = np.resize(self.fights, size)
+            self.rating[idx] = self.params['initial_rating']
+            self.rd[idx] = self.params['initial_rd']
+            self.last_day[idx] = -1
+            self.fights[idx] = 0
+        elif name is not None:
+            self.names[idx] = name
+        return idx
+
+    def _record(self, idx, day):
+        if self.n_hist == len(self.hist_fighter):
+            size = max(64, 2 * self.n_hist)
+            self.hist_fighter = np.resize(self.hist_fighter, size)
+            self.hist_day = np.resize(self.hist_day, size)
+            self.hist_rating = np.resize(self.hist_rating, size)
+            self.hist_rd = np.resize(self.hist_rd, size)
+        self.hist_fighter[self.n_hist] = idx
+        self.hist_day[self.n_hist] = day
+        self.hist_rating[self.n_hist] = self.rating[idx]
+        self.hist_rd[self.n_hist] = self.rd[idx]
+        self.n_hist += 1
+        self._hist_order = None
+
+    def _inflated_rd(self, idx, day):
+        if self.last_day[idx] < 0:
+            return self.rd[idx]
+        periods = (day - self.last_day[idx]) / self.params['period_days']
+        return min(np.sqrt(self.rd[idx] ** 2 + self.params['c'] ** 2 * periods), self.params['initial_rd'])
+
+    def update_bout(self, link_1, link_2, score_1, day, method=''):
+        """Update the ratings of both fighters for one bout.
+
+        Parameters
+        ----------
+        link_1 : str
+        link_2 : str
+        score_1 : float
+            1 if fighter 1 won, 0 if fighter 1 lost, 0.5 for a draw
+        day : int
+            days since 1970-01-01, see to_day
+        method : str, optional
+            Method of the bout, used for finish weighting
+        """
+        i = self.fighter_id(link_1)
+        j = self.fighter_id(link_2)
+        weights = self.params['finish_weights']
+        weight = weights.get(method, 1.0) if weights else 1.0
+        r_i, r_j = self.rating[i], self.rating[j]
+        if self.params['system'] == 'elo':
+            expected = 1 / (1 + 10 ** ((r_j - r_i) / 400))
+            delta = weight * self.params['k'] * (score_1 - expected)
+            self.rating[i] = r_i + delta
+            self.rating[j] = r_j - delta
+        else:
+            rd_i, rd_j = self._inflated_rd(i, day), self._inflated_rd(j, day)
+            for a, r_a, rd_a, r_b, rd_b, s in ((i, r_i, rd_i, r_j, rd_j, score_1),
+                                               (j, r_j, rd_j, r_i, rd_i, 1 - score_1)):
+                g = glicko_g(rd_b)
+                expected = 1 / (1 + 10 ** (-g * (r_a - r_b) / 400))
+                d_sq = 1 / (GLICKO_Q ** 2 * g ** 2 * expected * (1 - expected))
+                denom = 1 / rd_a ** 2 + 1 / d_sq
+                self.rating[a] = r_a + weight * GLICKO_Q / denom * g * (s - expected)
+                self.rd[a] = np.sqrt(1 / denom)
+        for a in (i, j):
+            self.last_day[a] = day
+            self.fights[a] += 1
+            self._record(a, day)
+
+    def unseen(self, fights):
+        """Select the bouts that have not been ingested yet.
+
+        Parameters
+        ----------
+        fights : pandas.DataFrame
+            rows in the format of All_Fights.csv
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        return fights[~bout_keys(fights).isin(self.seen_keys)]
+
+    def ingest(self, fights):
+        """Update ratings with bouts not processed yet.
+
+        Bouts are processed in date order, then in order on the card. Bouts already ingested are skipped,
+        and the rest must be on or after the most recently processed date, so ingesting a new event costs
+        O(new bouts). Bouts ending in a no contest do not change ratings.
+
+        Parameters
+        ----------
+        fights : pandas.DataFrame
+            rows in the format of All_Fights.csv
+
+        Returns
+        -------
+        int
+            number of bouts processed
+        """
+        df = self.unseen(fights).copy()
+        df['Key'] = bout_keys(df)
+        df['Day'] = to_day(df['EventDate'])
+        df['Position'] = df['CardPosition'].astype(str).str.split(' of ').str[0].astype(int)
+        df = df.sort_values(['Day', 'EventName', 'Position'], kind='stable')
+        if len(df) and df['Day'].iloc[0] < self.processed_day:
+            raise ValueError('Bouts predate the last processed event; rebuild the ratings from scratch instead.')
+
+        processed = 0
+        for row in df.itertuples(index=False):
+            self.seen_keys.add(row.Key)
+            self.processed_day = max(self.processed_day, row.Day)
+            score_1 = OUTCOME_SCORES.get(row.FighterOutcome1)
+            if score_1 is None:
+                continue
+            self.fighter_id(row.FighterLink1, row.FighterName1)
+            self.fighter_id(row.FighterLink2, row.FighterName2)
+            self.update_bout(row.FighterLink1, row.FighterLink2, score_1, row.Day, row.Method)
+            processed += 1
+        return processed
+
+    def ratings_as_of(self, links, dates):
+        """Look up ratings as they stood before the given dates, e.g. the pre-fight ratings of bouts.
+
+        Parameters
+        ----------
+        links : array-like of str
+        dates : array-like of datetime-like
+
+        Returns
+        -------
+        rating : numpy.ndarray
+        rd : numpy.ndarray
+            Glicko rating deviation at the time of the last bout, initial_rd for Elo or unseen fighters
+        """
+        links = np.atleast_1d(np.asarray(links, dtype=object))
+        days = np.atleast_1d(to_day(dates))
+        ids = np.array([self.index.get(link, -1) for link in links], dtype=np.int64)
+        rating = np.full(len(links), self.params['initial_rating'])
+        rd = np.full(len(links), self.params['initial_rd'])
+        if self.n_hist == 0:
+            return rating, rd
+
+        fighter = self.hist_fighter[:self.n_hist].astype(np.int64)
+        if self._hist_order is None:
+            self._hist_order = np.lexsort((self.hist_day[:self.n_hist], fighter))
+        order = self._hist_order
+        hist_keys = (fighter[order] << 32) + self.hist_day[:self.n_hist][order]
+        # last history entry of the same fighter strictly before the date
+        pos = np.searchsorted(hist_keys, (ids << 32) + days, side='left') - 1
+        found = (ids >= 0) & (pos >= 0)
+        found[found] = fighter[order[pos[found]]] == ids[found]
+        rating[found] = self.hist_rating[:self.n_hist][order[pos[found]]]
+        rd[found] = self.hist_rd[:self.n_hist][order[pos[found]]]
+        return rating, rd
+
+    def get_rating(self, link, as_of=None):
+        """Rating of a single fighter, current or as of a date.
+
+        Parameters
+        ----------
+        link : str
+        as_of : datetime-like, optional
+
+        Returns
+        -------
+        float
+        """
+        if as_of is None:
+            idx = self.index.get(link)
+            return self.params['initial_rating'] if idx is None else float(self.rating[idx])
+        return float(self.ratings_as_of([link], [as_of])[0][0])
+
+    def pre_fight_ratings(self, fights):
+        """Add the ratings of both fighters going into each bout.
+
+        Parameters
+        ----------
+        fights : pandas.DataFrame
+            rows in the format of All_Fights.csv
+
+        Returns
+        -------
+        pandas.DataFrame
+            copy of fights with Rating1, Rating2, RD1 and RD2 columns
+        """
+        df = fights.copy()
+        df['Rating1'], df['RD1'] = self.ratings_as_of(df['FighterLink1'], df['EventDate'])
+        df['Rating2'], df['RD2'] = self.ratings_as_of(df['FighterLink2'], df['EventDate'])
+        return df
+
+    def to_frame(self):
+        """Current rating of every fighter, best first.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        n = len(self.links)
+        df = pd.DataFrame({'FighterLink': self.links,
+                           'FighterName': self.names,
+                           'Rating': self.rating[:n],
+                           'RD': self.rd[:n],
+                           'UFCFights': self.fights[:n],
+                           'LastFightDate': pd.to_datetime(self.last_day[:n], unit='D')})
+        return df.sort_values('Rating', ascending=False, ignore_index=True)
+
+    def save(self, path):
+        """Save the engine state to a .npz file.
+
+        Parameters
+        ----------
+        path : str
+        """
+        n = len(self.links)
+        np.savez_compressed(path,
+                            params=np.array(json.dumps(self.params)),
+                            links=np.array(self.links, dtype=str),
+                            names=np.array(self.names, dtype=str),
+                            rating=self.rating[:n], rd=self.rd[:n],
+                            last_day=self.last_day[:n], fights=self.fights[:n],
+                            hist_fighter=self.hist_fighter[:self.n_hist],
+                            hist_day=self.hist_day[:self.n_hist],
+                            hist_rating=self.hist_rating[:self.n_hist],
+                            hist_rd=self.hist_rd[:self.n_hist],
+                            processed_day=np.array(self.processed_day),
+                            seen_keys=np.array(sorted(self.seen_keys), dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        """Load an engine saved with save.
+
+        Engines saved before fighters were keyed by link come back empty, so every bout is rated again.
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        RatingEngine
+        """
+        with np.load(path) as data:
+            engine = cls(**json.loads(str(data['params'])))
+            if 'links' not in data:
+                return engine
+            engine.links = data['links'].tolist()
+            engine.index = {link: i for i, link in enumerate(engine.links)}
+            engine.names = data['names'].tolist()
+            engine.rating = data['rating'].copy()
+            engine.rd = data['rd'].copy()
+            engine.last_day = data['last_day'].copy()
+            engine.fights = data['fights'].copy()
+            engine.hist_fighter = data['hist_fighter'].copy()
+            engine.hist_day = data['hist_day'].copy()
+            engine.hist_rating = data['hist_rating'].copy()
+            engine.hist_rd = data['hist_rd'].copy()
+            engine.n_hist = len(engine.hist_fighter)
+            engine.processed_day = int(data['processed_day'])
+            engine.seen_keys = set(data['seen_keys'].tolist())
+        return engine
+
+
+def update_ratings(system='elo', finish_weighted=True, rebuild=False):
+    """Bring the saved ratings up to date with All_Fights.csv, processing only bouts not seen before.
+
+    Parameters
+    ----------
+    system : str, optional
+        'elo' or 'glicko'
+    finish_weighted : bool, optional
+        Scale updates by DEFAULT_FINISH_WEIGHTS. Only used when the ratings are built from scratch.
+    rebuild : bool, optional
+        Ignore the saved state and rate every bout from the first event. Also done, with a warning, when
+        unrated bouts predate the last rated event, e.g. after an older event was backfilled.
+
+    Returns
+    -------
+    RatingEngine
+    """
+    ratings_dir = getcwd() + '/UFCStats_Dicts/Ratings/'
+    if not exists(ratings_dir):
+        makedirs(ratings_dir)
+    state_path = join(ratings_dir, system + '_ratings.npz')
+
+    if exists(state_path) and not rebuild:
+        engine = RatingEngine.load(state_path)
+    else:
+        engine = RatingEngine(system=system, finish_weights=DEFAULT_FINISH_WEIGHTS if finish_weighted else None)
+
+    df = load_all_fights()
+    backfilled = engine.unseen(df)
+    backfilled = backfilled[to_day(backfilled['EventDate']) < engine.processed_day]
+    if len(backfilled):
+        print('Warning:', len(backfilled), 'unrated bouts predate the last rated event, e.g.',
+              backfilled['EventName'].iloc[0] + '; rebuilding the ratings from scratch')
+        engine = RatingEngine(**engine.params)
+    processed = engine.ingest(df)
+    print('Rated', processed, 'new bouts')
+    engine.save(state_path)
+    engine.to_frame().to_csv(join(ratings_dir, system + '_ratings.csv'), index=False)
+    return engine
+
+
+if __name__ == '__main__':
+    update_ratings()
@@ -0,0 +1,197 @@
+import json
+import pandas as pd
+from datetime import date, datetime
+from os import listdir, getcwd, makedirs
+from os.path import isfile, join, exists, getmtime
+
+# Each fighter has UFCStats_Dicts/Snapshots/<fighter id>.jsonl with one line per profile version:
+#   {"EffectiveDate": "2021-03-06", "Changes": {"W": 21, "SLpM": "4.31", ...}}
+# The first line holds every field, later lines only the fields that changed. Lines are in date order,
+# so a profile as of a date is rebuilt by streaming the file and stopping at the first later version.
+
+# Record counts in a profile, kept as nullable ints when rows without a recorded version are filled with NA.
+COUNT_FIELDS = ['W', 'L', 'D', 'NC', 'TotalFights', 'UFCFights']
+
+
+def get_snapshot_dir():
+    """Directory holding the snapshot file of every fighter.
+
+    Returns
+    -------
+    str
+    """
+    return getcwd() + '/UFCStats_Dicts/Snapshots/'
+
+
+def get_snapshot_path(fighter_link):
+    """Snapshot file of a fighter, named by the id at the end of the fighter link.
+
+    Parameters
+    ----------
+    fighter_link : str
+
+    Returns
+    -------
+    str
+    """
+    return join(get_snapshot_dir(), fighter_link.split('/')[-1] + '.jsonl')
+
+
+def iter_versions(fighter_link):
+    """Yield (effective date, profile) for every version of a fighter, oldest first.
+
+    Only the current version is held in memory.
+
+    Parameters
+    ----------
+    fighter_link : str
+
+    Yields
+    ------
+    tuple of (datetime.date, dict)
+    """
+    path = get_snapshot_path(fighter_link)
+    if not exists(path):
+        return
+    profile = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            version = json.loads(line)
+            profile.update(version['Changes'])
+            yield date.fromisoformat(version['EffectiveDate']), profile
+
+
+def record_snapshot(fighter_stats, effective_date=None):
+    """Append the fields of a fighter profile that changed since the latest version.
+
+    Parameters
+    ----------
+    fighter_stats : dict
+        FighterStats as returned by parse_ufcstats_fighter
+    effective_date : datetime-like, optional
+        date the profile was observed, defaults to today
+
+    Returns
+    -------
+    bool
+        True if a new version was written
+    """
+    effective_date = date.today() if effective_date is None else pd.Timestamp(effective_date).date()
+    snapshot_dir = get_snapshot_dir()
+    if not exists(snapshot_dir):
+        makedirs(snapshot_dir)
+
+    latest_date, latest = None, {}
+    for latest_date, profile in iter_versions(fighter_stats['FighterLink']):
+        latest = profile
+    if latest_date is not None and effective_date < latest_date:
+        raise ValueError('Snapshot of ' + fighter_stats['FighterLink'] + ' predates its latest version '
+                         + latest_date.isoformat())
+
+    changes = {field: value for field, value in fighter_stats.items()
+               if field not in latest or latest[field] != value}
+    if not changes:
+        return False
+    with open(get_snapshot_path(fighter_stats['FighterLink']), 'a') as f:
+        f.write(json.dumps({'EffectiveDate': effective_date.isoformat(), 'Changes': changes}) + '\n')
+    return True
+
+
+def profile_as_of(fighter_link, as_of):
+    """Profile of a fighter as it was observed on a date.
+
+    Parameters
+    ----------
+    fighter_link : str
+    as_of : datetime-like
+
+    Returns
+    -------
+    dict or None
+        None if no version of the profile was recorded on or before the date
+    """
+    as_of = pd.Timestamp(as_of).date()
+    result = None
+    for effective_date, profile in iter_versions(fighter_link):
+        if effective_date > as_of:
+            break
+        result = dict(profile)
+    return result
+
+
+def profiles_as_of(bouts, link_column='FighterLink', date_column='EventDate', prefix=''):
+    """Profiles of the fighters in a table of bouts, each as of the date of its row.
+
+    Every snapshot file is streamed at most once, however many rows the fighter has. A version observed
+    on the date of a bout may already include its result, so pass the day before for pre-fight features.
+
+    Parameters
+    ----------
+    bouts : pandas.DataFrame
+    link_column : str, optional
+        column holding fighter links
+    date_column : str, optional
+        column holding dates
+    prefix : str, optional
+        prepended to the profile columns, e.g. 'Fighter1_'
+
+    Returns
+    -------
+    pandas.DataFrame
+        profile columns aligned with bouts.index; rows without a recorded version are empty, and the
+        COUNT_FIELDS are nullable Int64
+    """
+    dates = pd.to_datetime(bouts[date_column]).dt.date
+    rows = {}
+    for fighter_link, group in dates.groupby(bouts[link_column]):
+        # walk the versions and the requested dates together, both in date order
+        requests = sorted(zip(group.values, group.index))
+        i = 0
+        current = None
+        for effective_date, profile in iter_versions(fighter_link):
+            while i < len(requests) and requests[i][0] < effective_date:
+                if current is not None:
+                    rows[requests[i][1]] = current
+                i += 1
+            if i == len(requests):
+                break
+            current = dict(profile)
+        for _, row_index in requests[i:]:
+            if current is not None:
+                rows[row_index] = current
+    df = pd.DataFrame.from_dict(rows, orient='index').reindex(bouts.index)
+    for field in COUNT_FIELDS:
+        if field in df:
+            df[field] = df[field].astype('Int64')
+    return df.add_prefix(prefix)
+
+
+def snapshot_existing_profiles():
+    """Record the profiles in All_Fighters/ as versions effective on the day each json was written.
+
+    Useful once, to seed the snapshot store from fighter jsons scraped before it existed.
+
+    Returns
+    -------
+    int
+        number of versions written
+    """
+    all_fighters_dir = getcwd() + '/UFCStats_Dicts/All_Fighters/'
+    only_files = \
+        [f for f in listdir(all_fighters_dir) if isfile(join(all_fighters_dir, f)) and not f.startswith('.')]
+    written = 0
+    for fighter_filename in only_files:
+        with open(join(all_fighters_dir, fighter_filename)) as json_file:
+            fighter_stats = json.load(json_file)['FighterStats']
+        effective_date = datetime.fromtimestamp(getmtime(join(all_fighters_dir, fighter_filename))).date()
+        try:
+            written += record_snapshot(fighter_stats, effective_date)
+        except ValueError as err:
+            print(err)
+    return written
+
+
+if __name__ == '__main__':
+    print(snapshot_existing_profiles(), 'profile versions recorded')
@@ -54,6 +54,8 @@ def process_jsons_into_csv(need_to_process):
         round_format = []
         fighter_1_name = []
         fighter_2_name = []
+        fighter_1_link = []
+        fighter_2_link = []
         fighter_1_outcome = []
         fighter_2_outcome = []
         for event_filename in only_files:
@@ -74,8 +76,10 @@ def process_jsons_into_csv(need_to_process):
                     round_time.append(data[fight_idx_str]['RoundTime'])
                     round_format.append(data[fight_idx_str]['RoundFormat'])
                     fighter_1_name.append(data[fight_idx_str]['Fighter_1']['Name'])
+                    fighter_1_link.append(data[fight_idx_str]['Fighter_1']['UFCStats_Link'])
                     fighter_1_outcome.append(data[fight_idx_str]['Fighter_1']['Outcome'])
                     fighter_2_name.append(data[fight_idx_str]['Fighter_2']['Name'])
+                    fighter_2_link.append(data[fight_idx_str]['Fighter_2']['UFCStats_Link'])
                     fighter_2_outcome.append(data[fight_idx_str]['Fighter_2']['Outcome'])
 
         d = {'EventName': event_name,
@@ -90,6 +94,8 @@ def process_jsons_into_csv(need_to_process):
              'RoundFormat': round_format,
              'FighterName1': fighter_1_name,
              'FighterName2': fighter_2_name,
+             'FighterLink1': fighter_1_link,
+             'FighterLink2': fighter_2_link,
              'FighterOutcome1': fighter_1_outcome,
              'FighterOutcome2': fighter_2_outcome,
              'CardPosition': position_on_card}
@@ -99,3 +105,19 @@ def process_jsons_into_csv(need_to_process):
         df['EventDate'] = pd.to_datetime(df['EventDate'])
         df.sort_values(by='EventDate', inplace=True)
         df.to_csv(join(processed_events_dir, processed_filename), index=False)
+
+
+def load_all_fights():
+    """Read All_Fights.csv, processing the event jsons again if it was written before it had fighter links.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    processed_path = join(getcwd() + '/UFCStats_Dicts/Processed/', 'All_Fights.csv')
+    df = pd.read_csv(processed_path, parse_dates=['EventDate'])
+    if 'FighterLink1' not in df:
+        print('All_Fights.csv has no FighterLink columns; processing the event jsons again')
+        process_jsons_into_csv(True)
+        df = pd.read_csv(processed_path, parse_dates=['EventDate'])
+    return df
@@ -7,6 +7,8 @@ from os import getcwd, makedirs
 from os.path import exists, join
 from string import ascii_lowercase
 
+import Fighter_Snapshots
+
 # Need to remove DWCS fighters who have yet to compete in UFC
 # Need UFC W/L record. Also finish info.
 
@@ -205,6 +207,45 @@ def write_fighter_links(fighter_links, stat_dir, fighter_links_txt):
             f.write(str(s) + "\n")
 
 
+def scrape_fighter(fighter_link):
+    """Scrape fighter page and name the json file it will be saved to.
+
+    Changes to the profile are also recorded in the snapshot store, effective today.
+
+    Parameters
+    ----------
+    fighter_link : str
+        url to fighter history
+
+    Returns
+    -------
+    filename : str
+        json filename for the fighter, e.g. Jon_Jones_07f72a2a7591b409.json
+    f_dict : dict
+    """
+    f_dict = parse_ufcstats_fighter(fighter_link)
+    Fighter_Snapshots.record_snapshot(f_dict['FighterStats'])
+    filename = f_dict['FighterStats']['FighterName'].replace(' ', '_') + '_' + fighter_link.split('/')[-1] + '.json'
+    return filename, f_dict
+
+
+def write_fighter_json(f_dict, save_dir, filename):
+    """ Save scraped fighter to json file
+
+    Parameters
+    ----------
+    f_dict : dict
+        fighter to be saved
+    save_dir : str
+        directory name
+    filename : str
+        filename
+    """
+    json_object = json.dumps(f_dict, indent=4)
+    with open(join(save_dir, filename), 'w') as outfile:
+        outfile.write(json_object)
+
+
 def scrape_stats():
     """ Collect links to UFC fighters, then scrape fighter information and save to json file.
 
@@ -229,12 +270,9 @@ def scrape_stats():
 
     for f in fighter_links:
         print(f)
-        f_dict = parse_ufcstats_fighter(f)
-        filename = f_dict['FighterStats']['FighterName'].replace(' ', '_') + '_' + f.split('/')[-1] + '.json'
+        filename, f_dict = scrape_fighter(f)
         print(filename)
-        json_object = json.dumps(f_dict, indent=4)
-        with open(join(save_dir, filename), 'w') as outfile:
-            outfile.write(json_object)
+        write_fighter_json(f_dict, save_dir, filename)
 
 
 
@@ -398,6 +398,51 @@ def write_event_links(event_links, stat_dir, event_links_txt):
             f.write(str(s) + "\n")
 
 
+def scrape_event(event_link):
+    """Scrape every matchup of an event.
+
+    Parameters
+    ----------
+    event_link : str
+        url to event
+
+    Returns
+    -------
+    filename : str
+        json filename for the event, e.g. 20200307_UFC249.json
+    e_dict : dict
+        Info for entire event, with matchups keyed by position on card
+    """
+    m_links, e_dict = get_ufcstats_matchup_links(event_link)
+    for i, matchup_link in enumerate(m_links):
+        sleep(0.1)
+        bout_count = e_dict['FightCount'] - i
+        m_dict = parse_ufcstats_matchup(matchup_link)
+        e_dict[str(bout_count)] = m_dict
+
+    dt = datetime.strptime(e_dict['EventDate'], '%B %d, %Y')
+
+    filename = dt.strftime('%Y%m%d') + '_' + e_dict['EventName'].replace(" ", "") + '.json'
+    return filename, e_dict
+
+
+def write_event_json(e_dict, save_dir, filename):
+    """ Save scraped event to json file
+
+    Parameters
+    ----------
+    e_dict : dict
+        event to be saved
+    save_dir : str
+        directory name
+    filename : str
+        filename
+    """
+    json_object = json.dumps(e_dict, indent=4)
+    with open(join(save_dir, filename), 'w') as outfile:
+        outfile.write(json_object)
+
+
 def scrape_stats():
     """ Collect links to events, then scrape event information and save to json file.
 
@@ -436,20 +481,8 @@ def scrape_stats():
     if event_links:
         need_to_process = True
         for j, event_link in enumerate(event_links):
-            m_links, e_dict = get_ufcstats_matchup_links(event_link)
-            for i, matchup_link in enumerate(m_links):
-                sleep(0.1)
-                bout_count = e_dict['FightCount'] - i
-                m_dict = parse_ufcstats_matchup(matchup_link)
-                e_dict[str(bout_count)] = m_dict
-
-            dt = datetime.strptime(e_dict['EventDate'], '%B %d, %Y')
-
-            filename = dt.strftime('%Y%m%d') + '_' + e_dict['EventName'].replace(" ", "") + '.json'
-
-            json_object = json.dumps(e_dict, indent=4)
-            with open(join(save_dir, filename), 'w') as outfile:
-                outfile.write(json_object)
+            filename, e_dict = scrape_event(event_link)
+            write_event_json(e_dict, save_dir, filename)
     else:
         need_to_process = False
     return need_to_process
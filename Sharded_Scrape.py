@@ -0,0 +1,412 @@
+import argparse
+from os import getcwd, getpid, listdir, makedirs, remove, rename, replace, utime, open as os_open, close, write
+from os import O_CREAT, O_EXCL, O_WRONLY
+from os.path import exists, getmtime, isdir, join
+from shutil import rmtree
+from socket import gethostname
+from time import time
+
+import Scrape_All_UFCStats
+import Scrape_All_Career_UFCStats
+
+# Workers on one or several hosts share UFCStats_Dicts/Shards/<kind>/:
+#   work_list.txt        every link planned for this run
+#   batches/<batch>.txt  links split into batches
+#   leases/<batch>.lease worker holding the batch; mtime is the heartbeat
+#   output/<batch>/      json files of a finished batch, and FAILED_TXT listing links that could not be scraped
+#   done/<batch>.done    marker written once output/<batch>/ is in place
+# A lease whose mtime is older than lease_seconds is considered abandoned and can be reclaimed.
+
+KINDS = ('events', 'fighters')
+
+# Written inside the output directory of a batch, so it is handed off in the same rename as the jsons.
+FAILED_TXT = '.failed.txt'
+
+
+def get_shard_dir(kind):
+    """Directory holding the work list, leases and outputs of a sharded scrape.
+
+    Parameters
+    ----------
+    kind : str
+        'events' or 'fighters'
+
+    Returns
+    -------
+    str
+    """
+    if kind not in KINDS:
+        raise ValueError('kind must be one of ' + ', '.join(KINDS))
+    return join(getcwd(), 'UFCStats_Dicts', 'Shards', kind)
+
+
+def read_links(path):
+    """Read links from txt file, one per line.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    list of str
+    """
+    links = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                links.append(line.strip())
+    return links
+
+
+def write_links(links, path):
+    """Write links to txt file, one per line.
+
+    Parameters
+    ----------
+    links : list of str
+    path : str
+    """
+    with open(path, 'w') as f:
+        for s in links:
+            f.write(str(s) + "\n")
+
+
+def plan_work(kind, batch_size=10, full=False):
+    """Collect the links to be scraped and split them into batches that workers can claim.
+
+    Parameters
+    ----------
+    kind : str
+        'events' or 'fighters'
+    batch_size : int, optional
+        number of links per batch
+    full : bool, optional
+        For events, plan every completed event instead of only those missing from event_links.txt.
+        For fighters, fetch the fighter list again instead of using fighter_links.txt.
+
+    Returns
+    -------
+    int
+        number of batches available to workers
+    """
+    shard_dir = get_shard_dir(kind)
+    batch_dir = join(shard_dir, 'batches')
+    if exists(batch_dir):
+        print('A sharded scrape of', kind, 'is already planned in', shard_dir)
+        return len(listdir(batch_dir))
+
+    stat_dir = join(getcwd(), 'UFCStats_Dicts')
+    if kind == 'events':
+        links = Scrape_All_UFCStats.get_ufcstats_event_links()
+        # pop the upcoming event from list.
+        links.pop(0)
+        stored_txt = join(stat_dir, 'event_links.txt')
+        if not full and exists(stored_txt):
+            stored = set(read_links(stored_txt))
+            links = [link for link in links if link not in stored]
+    else:
+        stored_txt = join(stat_dir, 'fighter_links.txt')
+        if not full and exists(stored_txt):
+            links = read_links(stored_txt)
+        else:
+            links = Scrape_All_Career_UFCStats.get_ufcstats_fighter_links()
+
+    for d in ['batches', 'leases', 'output', 'done']:
+        makedirs(join(shard_dir, d), exist_ok=True)
+    write_links(links, join(shard_dir, 'work_list.txt'))
+    n_batches = 0
+    for start in range(0, len(links), batch_size):
+        batch_name = 'batch_{:05d}'.format(n_batches)
+        write_links(links[start:start + batch_size], join(batch_dir, batch_name + '.txt'))
+        n_batches += 1
+    print('Planned', len(links), kind, 'in', n_batches, 'batches')
+    return n_batches
+
+
+def lease_expired(lease_path, lease_seconds):
+    """Determine if a lease has not been renewed within lease_seconds.
+
+    Parameters
+    ----------
+    lease_path : str
+    lease_seconds : float
+
+    Returns
+    -------
+    bool
+    """
+    try:
+        return time() - getmtime(lease_path) > lease_seconds
+    except FileNotFoundError:
+        return True
+
+
+def acquire_lease(lease_path, worker_id, lease_seconds):
+    """Atomically create a lease file, reclaiming it first if the previous holder abandoned it.
+
+    Parameters
+    ----------
+    lease_path : str
+    worker_id : str
+    lease_seconds : float
+
+    Returns
+    -------
+    bool
+        True if worker_id now holds the lease
+    """
+    try:
+        fd = os_open(lease_path, O_CREAT | O_EXCL | O_WRONLY)
+    except FileExistsError:
+        if not lease_expired(lease_path, lease_seconds):
+            return False
+        # Only one reclaimer can win the rename of the abandoned lease.
+        stale_path = lease_path + '.' + worker_id + '.stale'
+        try:
+            rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return False
+        if not lease_expired(stale_path, lease_seconds):
+            # Another worker reclaimed the lease between our check and rename, so give it back.
+            try:
+                rename(stale_path, lease_path)
+            except OSError:
+                pass
+            return False
+        remove(stale_path)
+        try:
+            fd = os_open(lease_path, O_CREAT | O_EXCL | O_WRONLY)
+        except FileExistsError:
+            return False
+        print('Reclaimed abandoned lease', lease_path)
+    write(fd, worker_id.encode())
+    close(fd)
+    return True
+
+
+def renew_lease(lease_path, worker_id):
+    """Refresh the heartbeat of a lease, if it is still held by worker_id.
+
+    Parameters
+    ----------
+    lease_path : str
+    worker_id : str
+
+    Returns
+    -------
+    bool
+        False if the lease was lost, e.g. reclaimed by another worker after a long stall.
+    """
+    try:
+        with open(lease_path, 'r') as f:
+            holder = f.read().strip()
+        if holder != worker_id:
+            return False
+        utime(lease_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def release_lease(lease_path, worker_id):
+    """Remove a lease held by worker_id.
+
+    Parameters
+    ----------
+    lease_path : str
+    worker_id : str
+    """
+    if renew_lease(lease_path, worker_id):
+        try:
+            remove(lease_path)
+        except FileNotFoundError:
+            pass
+
+
+def claim_batch(shard_dir, worker_id, lease_seconds):
+    """Claim the first batch that is neither done nor leased by a live worker.
+
+    Parameters
+    ----------
+    shard_dir : str
+    worker_id : str
+    lease_seconds : float
+
+    Returns
+    -------
+    str or None
+        name of the claimed batch, None if no batch is available
+    """
+    for batch_file in sorted(listdir(join(shard_dir, 'batches'))):
+        batch_name = batch_file[:-len('.txt')]
+        if exists(join(shard_dir, 'done', batch_name + '.done')):
+            continue
+        lease_path = join(shard_dir, 'leases', batch_name + '.lease')
+        if acquire_lease(lease_path, worker_id, lease_seconds):
+            # the batch may have finished while we were acquiring the lease
+            if exists(join(shard_dir, 'done', batch_name + '.done')):
+                release_lease(lease_path, worker_id)
+                continue
+            return batch_name
+    return None
+
+
+def run_worker(kind, worker_id=None, lease_seconds=600):
+    """Claim batches and scrape them until no batch is left.
+
+    Output of a batch is written to a temporary directory and moved into place in a single rename,
+    so a batch is either handed off complete or not at all. A link that fails to scrape, e.g. on a
+    malformed page, is recorded in FAILED_TXT of the batch output and the rest of the batch still completes.
+
+    Parameters
+    ----------
+    kind : str
+        'events' or 'fighters'
+    worker_id : str, optional
+        defaults to <hostname>-<pid>
+    lease_seconds : float, optional
+        time without a heartbeat after which a lease may be reclaimed by another worker.
+        Must comfortably exceed the time to scrape one link.
+
+    Returns
+    -------
+    int
+        number of batches completed by this worker
+    """
+    shard_dir = get_shard_dir(kind)
+    if not exists(join(shard_dir, 'batches')):
+        print('Nothing planned for', kind, '- run plan first')
+        return 0
+    if worker_id is None:
+        worker_id = gethostname() + '-' + str(getpid())
+
+    completed = 0
+    while True:
+        batch_name = claim_batch(shard_dir, worker_id, lease_seconds)
+        if batch_name is None:
+            break
+        print(worker_id, 'claimed', batch_name)
+        lease_path = join(shard_dir, 'leases', batch_name + '.lease')
+        tmp_dir = join(shard_dir, 'output', '.' + batch_name + '_' + worker_id)
+        if exists(tmp_dir):
+            rmtree(tmp_dir)
+        makedirs(tmp_dir)
+
+        lost_lease = False
+        failed = []
+        for link in read_links(join(shard_dir, 'batches', batch_name + '.txt')):
+            if not renew_lease(lease_path, worker_id):
+                lost_lease = True
+                break
+            try:
+                if kind == 'events':
+                    filename, e_dict = Scrape_All_UFCStats.scrape_event(link)
+                    Scrape_All_UFCStats.write_event_json(e_dict, tmp_dir, filename)
+                else:
+                    filename, f_dict = Scrape_All_Career_UFCStats.scrape_fighter(link)
+                    Scrape_All_Career_UFCStats.write_fighter_json(f_dict, tmp_dir, filename)
+            except Exception as err:
+                print(worker_id, 'failed to scrape', link, '-', repr(err))
+                failed.append(link)
+
+        if lost_lease or not renew_lease(lease_path, worker_id):
+            print(worker_id, 'lost lease on', batch_name)
+            rmtree(tmp_dir)
+            continue
+        if failed:
+            write_links(failed, join(tmp_dir, FAILED_TXT))
+        try:
+            rename(tmp_dir, join(shard_dir, 'output', batch_name))
+        except OSError:
+            # another worker already handed off this batch
+            rmtree(tmp_dir)
+        open(join(shard_dir, 'done', batch_name + '.done'), 'w').close()
+        release_lease(lease_path, worker_id)
+        completed += 1
+    print(worker_id, 'finished after', completed, 'batches')
+    return completed
+
+
+def merge_shards(kind):
+    """Move the output of all batches into All_Events/ or All_Fighters/ and record the scraped links.
+
+    Links that failed to scrape are reported. Failed events are left out of event_links.txt, and failed
+    fighters stay in fighter_links.txt, so the next plan and the serial scrapers pick them up again.
+
+    Parameters
+    ----------
+    kind : str
+        'events' or 'fighters'
+
+    Returns
+    -------
+    bool
+        determines if necessary to process jsons again
+    """
+    shard_dir = get_shard_dir(kind)
+    batch_dir = join(shard_dir, 'batches')
+    if not exists(batch_dir):
+        print('Nothing planned for', kind)
+        return False
+    batch_names = [f[:-len('.txt')] for f in sorted(listdir(batch_dir))]
+    remaining = [b for b in batch_names if not exists(join(shard_dir, 'done', b + '.done'))]
+    if remaining:
+        print(len(remaining), 'of', len(batch_names), 'batches are not done yet, e.g.', remaining[0])
+        return False
+
+    stat_dir = join(getcwd(), 'UFCStats_Dicts')
+    if kind == 'events':
+        save_dir = join(stat_dir, 'All_Events')
+        links_txt = join(stat_dir, 'event_links.txt')
+    else:
+        save_dir = join(stat_dir, 'All_Fighters')
+        links_txt = join(stat_dir, 'fighter_links.txt')
+    makedirs(save_dir, exist_ok=True)
+
+    merged = 0
+    failed = []
+    for batch_name in batch_names:
+        out_dir = join(shard_dir, 'output', batch_name)
+        if not isdir(out_dir):
+            continue
+        for filename in listdir(out_dir):
+            if filename == FAILED_TXT:
+                failed += read_links(join(out_dir, filename))
+                continue
+            replace(join(out_dir, filename), join(save_dir, filename))
+            merged += 1
+
+    if failed:
+        print(len(failed), kind, 'failed to scrape and will be retried by the next plan:')
+        for link in failed:
+            print('   ', link)
+
+    links = read_links(links_txt) if exists(links_txt) else []
+    # event_links.txt lists the events scraped so far, while fighter_links.txt lists every fighter
+    skip = set(links) | set(failed) if kind == 'events' else set(links)
+    links += [link for link in read_links(join(shard_dir, 'work_list.txt')) if link not in skip]
+    write_links(links, links_txt)
+
+    rmtree(shard_dir)
+    print('Merged', merged, kind, 'into', save_dir)
+    return merged > 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape UFCStats with several workers sharing a filesystem.')
+    parser.add_argument('step', choices=['plan', 'work', 'merge'])
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--full', action='store_true', help='plan a full historical re-scrape')
+    parser.add_argument('--worker-id', default=None)
+    parser.add_argument('--lease-seconds', type=float, default=600)
+    args = parser.parse_args()
+
+    if args.step == 'plan':
+        plan_work(args.kind, batch_size=args.batch_size, full=args.full)
+    elif args.step == 'work':
+        run_worker(args.kind, worker_id=args.worker_id, lease_seconds=args.lease_seconds)
+    elif merge_shards(args.kind) and args.kind == 'events':
+        import Process_Entire_History
+        Process_Entire_History.process_jsons_into_csv(True)
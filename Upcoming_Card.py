@@ -0,0 +1,382 @@
+import argparse
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import listdir, getcwd
+from os.path import isfile, join, exists, getmtime
+from time import sleep
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+
+import Scrape_All_UFCStats
+from Analysis_Data import finish_flags
+from Process_Entire_History import find_weight_class
+
+# Combined prior UFC fights of both fighters, bucketed for the base finish rates.
+EXPERIENCE_BUCKETS = [0, 1, 2, 3, 6, 11, 21]
+
+# Weight of the base rate, in bouts, when shrinking a fighter's own finish rate toward it.
+PRIOR_BOUTS = 5
+
+# Fewest bouts in a (weight class, experience) cell before its rate is used instead of the experience-only rate.
+MIN_CELL_BOUTS = 30
+
+
+def experience_bucket(combined_fights):
+    """Index of the experience bucket for the combined prior UFC fights of a matchup.
+
+    Parameters
+    ----------
+    combined_fights : int
+
+    Returns
+    -------
+    int
+    """
+    bucket = 0
+    for i, lower in enumerate(EXPERIENCE_BUCKETS):
+        if combined_fights >= lower:
+            bucket = i
+    return bucket
+
+
+def parse_upcoming_card(event_url):
+    """Parse the matchups of an event that has not happened yet.
+
+    Parameters
+    ----------
+    event_url : str
+
+    Returns
+    -------
+    dict
+        EventName, EventDate, EventLocation, EventURL, FightCount and Bouts, a list of matchups with
+        Position (1 is the first fight of the night), WeightClass, FighterName1/2 and FighterLink1/2
+    """
+    soup = Scrape_All_UFCStats.get_soup(event_url)
+    event_name = soup.select("body > section > div > h2 > span")
+    event_info = soup.select("div.b-list__info-box.b-list__info-box_style_large-width > ul > li")
+    rows = soup.select("tbody.b-fight-details__table-body > tr")
+    bouts = []
+    for i, row in enumerate(rows):
+        cols = row.select('td')
+        fighters = cols[1].select('a[href]')
+        bouts.append({'Position': len(rows) - i,
+                      'WeightClass': find_weight_class(cols[6].text.strip()),
+                      'FighterName1': fighters[0].text.strip(),
+                      'FighterLink1': fighters[0]['href'],
+                      'FighterName2': fighters[1].text.strip(),
+                      'FighterLink2': fighters[1]['href'],
+                      'MatchupURL': row.get('data-link', '')})
+    return {'EventName': event_name[0].text.strip(),
+            'EventDate': event_info[0].text.split(':')[1].strip(),
+            'EventLocation': event_info[1].text.split(':')[1].strip(),
+            'EventURL': event_url,
+            'FightCount': len(bouts),
+            'Bouts': bouts}
+
+
+class FeatureStore:
+    """Career-to-date features of every fighter, held in memory and built from the event jsons.
+
+    Events are ingested in date order. update() only reads event jsons that are new, and starts over
+    when one changed, disappeared or is older than an event already ingested. Alongside the fighter
+    features, finish counts of past bouts are kept by weight class and combined prior experience to serve
+    as base rates.
+    """
+
+    def __init__(self):
+        self.events_dir = getcwd() + '/UFCStats_Dicts/All_Events/'
+        # event filename -> (modification time, sha1 of the content)
+        self.loaded_events = {}
+        # FighterLink -> [UFC fights, bouts ending in a finish, wins]
+        self.fighters = {}
+        # (WeightClass, bucket) and (None, bucket) -> [finishes, bouts]
+        self.base_counts = {}
+        self.lock = threading.Lock()
+
+    def fighter(self, fighter_link):
+        """Career-to-date features of a fighter; zeros for a UFC debut.
+
+        Parameters
+        ----------
+        fighter_link : str
+
+        Returns
+        -------
+        dict
+        """
+        fights, finishes, wins = self.fighters.get(fighter_link, [0, 0, 0])
+        return {'UFCFights': fights, 'Finishes': finishes, 'Wins': wins}
+
+    def ingest_event(self, data):
+        """Add the bouts of one event to the features.
+
+        Parameters
+        ----------
+        data : dict
+            event as written by Scrape_All_UFCStats.scrape_event
+        """
+        fights = [data[str(fight_idx)] for fight_idx in range(1, data['FightCount'] + 1)]
+        finishes = finish_flags(pd.Series([fight['Method'] for fight in fights], dtype=object),
+                                pd.Series([fight['Round'] for fight in fights], dtype=object),
+                                pd.Series([fight['RoundTime'] for fight in fights], dtype=object))
+        for fight, finish in zip(fights, finishes.eq(True).tolist()):
+            links = [fight['Fighter_1']['UFCStats_Link'], fight['Fighter_2']['UFCStats_Link']]
+            combined = sum(self.fighters.get(link, [0])[0] for link in links)
+            bucket = experience_bucket(combined)
+            for key in [(find_weight_class(fight['WeightClass']), bucket), (None, bucket)]:
+                counts = self.base_counts.setdefault(key, [0, 0])
+                counts[0] += finish
+                counts[1] += 1
+            for fighter in [fight['Fighter_1'], fight['Fighter_2']]:
+                counts = self.fighters.setdefault(fighter['UFCStats_Link'], [0, 0, 0])
+                counts[0] += 1
+                counts[1] += finish
+                counts[2] += fighter['Outcome'] == 'W'
+
+    def update(self):
+        """Ingest event jsons that are new or changed since they were loaded.
+
+        Files whose modification time changed only count as changed if their content did too. New events
+        after every loaded one are added to the features. Anything else would be ingested out of date order,
+        so the features are built again from every event json.
+
+        Returns
+        -------
+        int
+            number of events ingested
+        """
+        if not exists(self.events_dir):
+            return 0
+        # filenames start with the event date, so sorting keeps the events in date order
+        only_files = sorted(f for f in listdir(self.events_dir)
+                            if isfile(join(self.events_dir, f)) and not f.startswith('.'))
+        versions = {}
+        contents = {}
+        for event_filename in only_files:
+            mtime = getmtime(join(self.events_dir, event_filename))
+            loaded = self.loaded_events.get(event_filename)
+            if loaded is not None and loaded[0] == mtime:
+                versions[event_filename] = loaded
+                continue
+            with open(join(self.events_dir, event_filename), 'rb') as json_file:
+                content = json_file.read()
+            versions[event_filename] = (mtime, hashlib.sha1(content).hexdigest())
+            if loaded is None or loaded[1] != versions[event_filename][1]:
+                contents[event_filename] = content
+        changed = sorted(contents)
+        rebuild = bool(set(self.loaded_events) - set(only_files)) or \
+            bool(changed and self.loaded_events and changed[0] <= max(self.loaded_events))
+        to_ingest = only_files if rebuild else changed
+        if rebuild:
+            print('Event jsons changed, disappeared or were backfilled; building the features again')
+        with self.lock:
+            if rebuild:
+                self.fighters = {}
+                self.base_counts = {}
+            for event_filename in to_ingest:
+                if event_filename in contents:
+                    self.ingest_event(json.loads(contents[event_filename]))
+                else:
+                    with open(join(self.events_dir, event_filename)) as json_file:
+                        self.ingest_event(json.load(json_file))
+            self.loaded_events = versions
+        return len(to_ingest)
+
+    def base_rate(self, weight_class, bucket):
+        """Historical finish rate of bouts in a weight class with similar combined experience.
+
+        Parameters
+        ----------
+        weight_class : str
+        bucket : int
+
+        Returns
+        -------
+        float
+        """
+        finishes, bouts = self.base_counts.get((weight_class, bucket), [0, 0])
+        if bouts < MIN_CELL_BOUTS:
+            finishes, bouts = self.base_counts.get((None, bucket), [0, 0])
+        if bouts == 0:
+            return 0.5
+        return finishes / bouts
+
+
+def score_bout(store, bout):
+    """Score an upcoming matchup from career-to-date features.
+
+    FinishProbability is the mean of both fighters' finish rates, each shrunk toward the historical
+    finish rate of bouts with the same weight class and combined experience.
+
+    Parameters
+    ----------
+    store : FeatureStore
+    bout : dict
+        matchup as returned in parse_upcoming_card Bouts
+
+    Returns
+    -------
+    dict
+        bout with UFCFights1/2, CombinedUFCFights, ExperienceGap and FinishProbability
+    """
+    f1 = store.fighter(bout['FighterLink1'])
+    f2 = store.fighter(bout['FighterLink2'])
+    combined = f1['UFCFights'] + f2['UFCFights']
+    base = store.base_rate(bout['WeightClass'], experience_bucket(combined))
+    rates = [(f['Finishes'] + PRIOR_BOUTS * base) / (f['UFCFights'] + PRIOR_BOUTS) for f in [f1, f2]]
+    scored = dict(bout)
+    scored.update({'UFCFights1': f1['UFCFights'],
+                   'UFCFights2': f2['UFCFights'],
+                   'CombinedUFCFights': combined,
+                   'ExperienceGap': abs(f1['UFCFights'] - f2['UFCFights']),
+                   'FinishProbability': round(sum(rates) / 2, 4)})
+    return scored
+
+
+class CardService:
+    """Keeps the upcoming card and its scores in memory, rescoring only matchups that changed."""
+
+    def __init__(self, event_url=None):
+        self.store = FeatureStore()
+        self.event_url = event_url
+        self.card = None
+        self.scores = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Fetch the upcoming card again and rescore new or changed matchups.
+
+        Returns
+        -------
+        int
+            number of matchups scored
+        """
+        new_events = self.store.update()
+        event_url = self.event_url or Scrape_All_UFCStats.get_ufcstats_event_links()[0]
+        card = parse_upcoming_card(event_url)
+        with self.lock:
+            if new_events:
+                # career features moved, so every matchup needs new scores
+                self.scores = {}
+            scores = {}
+            rescored = 0
+            for bout in card['Bouts']:
+                key = (bout['FighterLink1'], bout['FighterLink2'], bout['WeightClass'], bout['Position'])
+                if key not in self.scores:
+                    self.scores[key] = score_bout(self.store, bout)
+                    rescored += 1
+                scores[key] = self.scores[key]
+            self.scores = scores
+            self.card = card
+        return rescored
+
+    def get_scores(self, position=None):
+        """Scored matchups of the card, first fight of the night first.
+
+        Parameters
+        ----------
+        position : int, optional
+            Only the matchup at this position on the card.
+
+        Returns
+        -------
+        dict
+        """
+        with self.lock:
+            bouts = sorted(self.scores.values(), key=lambda b: b['Position'])
+            if position is not None:
+                bouts = [b for b in bouts if b['Position'] == position]
+            return {'EventName': self.card['EventName'] if self.card else '',
+                    'EventDate': self.card['EventDate'] if self.card else '',
+                    'Bouts': bouts}
+
+
+def make_handler(service):
+    """Build a request handler serving GET /card and GET /card?position=N as json.
+
+    Parameters
+    ----------
+    service : CardService
+
+    Returns
+    -------
+    type
+    """
+    class CardHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/card':
+                self.send_error(404)
+                return
+            position = parse_qs(url.query).get('position')
+            try:
+                position = int(position[0]) if position else None
+            except ValueError:
+                self.send_error(400, 'position must be an int')
+                return
+            body = json.dumps(service.get_scores(position)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return CardHandler
+
+
+def serve(port=8000, refresh_seconds=900, event_url=None):
+    """Serve scores for the upcoming card on localhost, refreshing the card in the background.
+
+    Parameters
+    ----------
+    port : int, optional
+    refresh_seconds : float, optional
+        time between checks for changes to the card and for new event jsons
+    event_url : str, optional
+        defaults to the next upcoming event on UFCStats
+    """
+    service = CardService(event_url)
+    service.refresh()
+
+    def refresh_loop():
+        while True:
+            sleep(refresh_seconds)
+            try:
+                rescored = service.refresh()
+                if rescored:
+                    print('Rescored', rescored, 'matchups')
+            except Exception as err:
+                print('Refresh failed:', err)
+
+    threading.Thread(target=refresh_loop, daemon=True).start()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(service))
+    print('Serving', service.card['EventName'], 'on http://127.0.0.1:' + str(port) + '/card')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score the upcoming UFC card.')
+    parser.add_argument('command', choices=['show', 'serve'], nargs='?', default='show')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--refresh-seconds', type=float, default=900)
+    parser.add_argument('--event-url', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.port, args.refresh_seconds, args.event_url)
+    else:
+        card_service = CardService(args.event_url)
+        card_service.refresh()
+        card_scores = card_service.get_scores()
+        print(card_scores['EventName'], card_scores['EventDate'])
+        for b in card_scores['Bouts']:
+            print('{:>2} {:<18} {:<25} vs {:<25} finish {:.2f}  experience gap {}'.format(
+                b['Position'], b['WeightClass'], b['FighterName1'], b['FighterName2'],
+                b['FinishProbability'], b['ExperienceGap']))
@@ -2,6 +2,9 @@
 
 import Scrape_All_UFCStats
 import Process_Entire_History
+import Fighter_Ratings
 
 need_to_process = Scrape_All_UFCStats.scrape_stats()
-Process_Entire_History.process_jsons_into_csv(need_to_process)
\ No newline at end of file
+Process_Entire_History.process_jsons_into_csv(need_to_process)
+if need_to_process:
+    Fighter_Ratings.update_ratings()
\ No newline at end of file